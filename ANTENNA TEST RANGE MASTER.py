@@ -6,16 +6,30 @@ import tkinter as tk
 import time
 import serial
 import settings
-from decimal import *
 import pprint
-import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-from matplotlib.figure import Figure
 from datetime import datetime
-import sys
 import os
+import io
+import re
 import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Constant GRBL commands, encoded once
+GRBL_STATUS_QUERY = b'?'
+GRBL_HOME_ALL = b'$H\n'
+GRBL_HOME_X = b'$HX\n'
+GRBL_HOME_Y = b'$HY\n'
+GRBL_HOME_A = b'$HA\n'
+GRBL_GOTO_ZERO = b'X0 Y0 Z0 A0\n'
+GRBL_DWELL_SYNC = b'G4 P0\n'  # Acknowledged only once all queued motion has finished
+
+# Move templates, filled with bytes % (x, y) so no str is built and encoded per move
+GRBL_JOG_FMT = b'G0 X%.4f Y%.4f Z0 A0\n'  # Include default Z value
+GRBL_MOVE_FMT = b'G0 X%.4f Y%.4f Z0\n'  # Include default Z value
+
+# GRBL idle status report, e.g. <Idle|WPos:0.000,0.000,0.000,0.000,0.000,0.000|FS:0,0>
+GRBL_IDLE_WPOS = re.compile(rb'<Idle\|WPos:([-\d.]+),([-\d.]+),([-\d.]+),([-\d.]+)')
 
 class manual_control_App(ctk.CTkToplevel):
     def __init__(self, parent):
@@ -135,6 +149,7 @@ class manual_control_App(ctk.CTkToplevel):
         #TEXTBOX
         self.textbox = ctk.CTkTextbox(self, height=100, width=1500, wrap="word")
         self.textbox.grid(row=5, column=4, padx=10, pady=10)
+        self.displayed_text = None
 
 
 
@@ -145,19 +160,16 @@ class manual_control_App(ctk.CTkToplevel):
     def connect_to_controller(self):
         try:
             self.serial_connection = serial.Serial(settings.COM_PORT, settings.BAUD_RATE, timeout=2)
-            time.sleep(0.5)
-            self.serial_connection.write(b'?')
-            response = self.serial_connection.readline().decode('utf-8').strip()
-
-            if response.startswith('<Idle|WPos:'):
-                values = response.split(':')[1].split(',')
-                if len(values) == 6:
-                    x, y, z, a, b, c = values
-                    self.update_textbox(f"Connected. Position at connection time is X{x} Y{y} A{a}\n")
-                    self.connect_button.configure(text='Connected', state=tk.DISABLED)
-
-                else:
-                    self.update_textbox("Invalid response format.")
+            # Opening the port resets the controller; block until its start-up banner arrives (or the port times out)
+            self.serial_connection.read_until(b'Grbl')
+            self.serial_connection.write(GRBL_STATUS_QUERY)
+            response = self.read_status()  # Skips the rest of the banner and any start-up messages
+            match = GRBL_IDLE_WPOS.match(response)
+
+            if match:
+                x, y, z, a = (value.decode('ascii') for value in match.groups())  # Only the coordinates are decoded, for display
+                self.update_textbox(f"Connected. Position at connection time is X{x} Y{y} A{a}\n")
+                self.connect_button.configure(text='Connected', state=tk.DISABLED)
             else:
                 self.update_textbox("Failed to connect: Invalid response.")
         except serial.SerialException as e:
@@ -165,6 +177,9 @@ class manual_control_App(ctk.CTkToplevel):
 
     def update_textbox(self, text):
         """Updates the textbox with new text."""
+        if text == self.displayed_text:  # Already showing this, skip the redraw
+            return
+        self.displayed_text = text
         self.textbox.delete("1.0", "end")  # Clear previous text
         self.textbox.insert("end", text)  # Insert new text
 
@@ -173,7 +188,7 @@ class manual_control_App(ctk.CTkToplevel):
         x = position[0] - 10.0
         y = position[1]
         z = position[2]
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def xminus1(self):
         position = self.get_position()
@@ -183,7 +198,7 @@ class manual_control_App(ctk.CTkToplevel):
 
 
 
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def xminus0p1(self):
         position = self.get_position()
@@ -193,7 +208,7 @@ class manual_control_App(ctk.CTkToplevel):
 
 
 
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def xminus0p02(self):
         position = self.get_position()
@@ -203,7 +218,7 @@ class manual_control_App(ctk.CTkToplevel):
 
 
 
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def xplus0p02(self):
         position = self.get_position()
@@ -213,7 +228,7 @@ class manual_control_App(ctk.CTkToplevel):
 
 
 
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def xplus0p1(self):
         position = self.get_position()
@@ -223,7 +238,7 @@ class manual_control_App(ctk.CTkToplevel):
 
 
 
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def xplus1(self):
         position = self.get_position()
@@ -233,7 +248,7 @@ class manual_control_App(ctk.CTkToplevel):
 
 
 
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def xplus10(self):
         position = self.get_position()
@@ -243,7 +258,7 @@ class manual_control_App(ctk.CTkToplevel):
 
 
 
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def yminus10(self):
         position = self.get_position()
@@ -253,7 +268,7 @@ class manual_control_App(ctk.CTkToplevel):
 
 
 
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def yminus1(self):
         position = self.get_position()
@@ -263,7 +278,7 @@ class manual_control_App(ctk.CTkToplevel):
 
 
 
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def yminus0p1(self):
         position = self.get_position()
@@ -273,7 +288,7 @@ class manual_control_App(ctk.CTkToplevel):
 
 
 
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def yminus0p02(self):
         position = self.get_position()
@@ -281,7 +296,7 @@ class manual_control_App(ctk.CTkToplevel):
         y = position[1] - 0.02
         z = position[2]
 
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def yplus0p02(self):
         position = self.get_position()
@@ -289,7 +304,7 @@ class manual_control_App(ctk.CTkToplevel):
         y = position[1] + 0.02
         z = position[2]
 
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def yplus0p1(self):
         position = self.get_position()
@@ -299,7 +314,7 @@ class manual_control_App(ctk.CTkToplevel):
 
         print(x, y, z)
 
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def yplus1(self):
         position = self.get_position()
@@ -307,7 +322,7 @@ class manual_control_App(ctk.CTkToplevel):
         y = position[1] + 1.0
         z = position[2]
 
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def yplus10(self):
         position = self.get_position()
@@ -315,38 +330,36 @@ class manual_control_App(ctk.CTkToplevel):
         y = position[1] + 10.0
         z = position[2]
 
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0 A0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_JOG_FMT % (x, y))
 
     def homex(self):
-        self.serial_connection.write(('$HX\n').encode('utf-8'))
+        self.serial_connection.write(GRBL_HOME_X)
 
     def homey(self):
-        self.serial_connection.write(('$HY\n').encode('utf-8'))
+        self.serial_connection.write(GRBL_HOME_Y)
 
     def homea(self):
-        self.serial_connection.write(('$HA\n').encode('utf-8'))
+        self.serial_connection.write(GRBL_HOME_A)
 
     def homeALL(self):
-        self.serial_connection.write(('$H\n').encode('utf-8'))
+        self.serial_connection.write(GRBL_HOME_ALL)
 
     def goto0(self):
 
-        self.serial_connection.write(('X0 Y0 Z0 A0\n').encode('utf-8'))
+        self.serial_connection.write(GRBL_GOTO_ZERO)
 
     def get_position(self):
         try:
-            self.serial_connection.flushInput()
-            self.serial_connection.write(('?').encode('utf-8'))
-            time.sleep(0.1)
-            response = self.serial_connection.readline().decode('utf-8').strip()
+            self.serial_connection.write(GRBL_STATUS_QUERY)
+            response = self.read_status()
+            match = GRBL_IDLE_WPOS.match(response)
 
-            if '<Idle|WPos:' in response:
+            if match:
                 try:
-                    values = response.split('|')[1].split(':')[1].split(',')
-                    x, y, z, a = float(values[0]), float(values[1]), float(values[2]), float(values[3])
+                    x, y, z, a = (float(value) for value in match.groups())
                     self.update_textbox(f"Current Position: X{x} Y{y} A{a}")
-                    return float(x), float(y), float(a)
-                except (IndexError, ValueError):
+                    return x, y, a
+                except ValueError:
                     self.update_textbox("Invalid response format for position.")
                     return None, None, None
             else:
@@ -356,6 +369,16 @@ class manual_control_App(ctk.CTkToplevel):
             self.update_textbox(f"Error in getting position: {str(e)}")
             return None, None, None
 
+    def read_status(self, timeout=2):
+        """Returns the next GRBL status report, skipping the 'ok' replies to
+        earlier moves that are still queued. Returns b'' if none arrives in time."""
+        t0 = time.monotonic()
+        while time.monotonic() - t0 < timeout:
+            line = self.serial_connection.readline().strip()  # Blocks until newline or port timeout
+            if line.startswith(b'<'):
+                return line
+        return b''
+
     def close(self):
         self.destroy()
 
@@ -366,6 +389,12 @@ class SFP(ctk.CTkToplevel):
         self.attributes("-topmost", True)
         self.lift()
         self.after(10, lambda: self.focus_force())
+        self.frequency_points = None  # Sweep frequencies in GHz, cleared whenever the sweep is reprogrammed
+        self.frequency_axis_cache = {}  # (start Hz, stop Hz, points) -> frequencies in GHz
+        self.plot = None  # Trace figure, built on the first DISPLAY TRACE and reused afterwards
+        self.trace_executor = ThreadPoolExecutor(max_workers=1)  # One worker keeps trace reads in order
+        self.trace_future = None
+        self.vna_lock = threading.RLock()  # Held for every VNA transfer and frequency cache update, from either thread
         self.start_gui()
         self.protocol("WM_DELETE_WINDOW", self.on_close)
         self.connect()
@@ -438,18 +467,60 @@ class SFP(ctk.CTkToplevel):
         self.close_button = ctk.CTkButton(self, text="CLOSE", command=self.close)
         self.close_button.grid(row=4, column=3, padx=1, pady=1)
 
+        if self.trace_future is not None and not self.trace_future.done():
+            self.set_trace_controls(tk.DISABLED)  # Back on the main menu while a trace is still being read
+
+    def set_trace_controls(self, state):
+        """Enables or disables every button that talks to the VNA, so none of them
+        blocks the window on vna_lock while the worker is reading a trace."""
+        for button in (self.meas, self.formatbutton, self.scalerefbutton, self.startbutton, self.stopbutton,
+                       self.powerbutton, self.centrebutton, self.spanbutton, self.readtracebutton,
+                       self.exportcsvbutton, self.clear_error_messages_button):
+            if button.winfo_exists():
+                button.configure(state=state)
+
     def clear(self):
-        self.write("*RST")
+        with self.vna_lock:
+            self.frequency_points = None  # Forget the old sweep first, even if the preset below does not complete
+            try:
+                self.write_sync("*RST", timeout=30000)
+            except pyvisa.VisaIOError:
+                print("VNA RESET DID NOT COMPLETE")
 
     def write(self, msg):
-        self.VNA.write(msg)
-        time.sleep(0.1)
+        with self.vna_lock:
+            self.VNA.write(msg)
+
+    def write_sync(self, msg, timeout=None):
+        """Writes a command and blocks until the VNA reports it has completed.
+
+        Args:
+            msg (str): Command to send
+            timeout (int): Milliseconds to wait for completion, defaults to the VISA timeout
+        """
+        with self.vna_lock:
+            self.VNA.write(msg)
+            previous_timeout = self.VNA.timeout
+            if timeout is not None:
+                self.VNA.timeout = timeout  # Only for this call
+            try:
+                self.VNA.query("*OPC?")
+            finally:
+                self.VNA.timeout = previous_timeout
+
+    def write_sweep(self, msg):
+        """Writes a sweep setting and forgets the cached frequency axis in the same
+        locked step, so a trace read in progress cannot cache the old sweep's frequencies."""
+        with self.vna_lock:
+            self.VNA.write(msg)
+            self.frequency_points = None
 
     def connect(self):
         try:
             self.rm = pyvisa.ResourceManager()
-            self.VNA = self.rm.open_resource("GPIB0::16::INSTR")
-            print(self.VNA.query("*IDN?"))
+            with self.vna_lock:
+                self.VNA = self.rm.open_resource("GPIB0::16::INSTR")
+                print(self.VNA.query("*IDN?"))
             self.connectButton.configure(text='Connected', state=tk.DISABLED)
             self.connected_flag = True
         except pyvisa.VisaIOError:
@@ -488,9 +559,11 @@ class SFP(ctk.CTkToplevel):
         self.write("S22")
 
     def on_close(self):
+        self.trace_executor.shutdown(wait=False)
         if self.VNA:
-            self.VNA.control_ren(0)
-            self.VNA.close()
+            with self.vna_lock:  # Let a trace read in progress finish first
+                self.VNA.control_ren(0)
+                self.VNA.close()
             print("VNA disconnected")
         self.destroy()
 
@@ -580,8 +653,7 @@ class SFP(ctk.CTkToplevel):
 
     def getstart(self):
         self.start = str(self.estart.get())
-        self.write("STAR " + self.start + "GHz")
-        time.sleep(0.1)
+        self.write_sweep("STAR " + self.start + "GHz")
 
     def stop(self):
         self.erase_gui()
@@ -600,8 +672,7 @@ class SFP(ctk.CTkToplevel):
 
     def getstop(self):
         self.stop = str(self.estop.get())
-        self.write("STOP " + self.stop + "GHz")
-        time.sleep(0.1)
+        self.write_sweep("STOP " + self.stop + "GHz")
 
     def power(self):
         self.erase_gui()
@@ -621,7 +692,6 @@ class SFP(ctk.CTkToplevel):
     def getpower(self):
         self.power = str(self.epower.get())
         self.write("POWE " + self.power)
-        time.sleep(0.1)
 
     def centre(self):
         self.erase_gui()
@@ -640,8 +710,7 @@ class SFP(ctk.CTkToplevel):
 
     def getcentre(self):
         self.centre = str(self.ecentre.get())
-        self.write("CENT " + self.centre + "GHz")
-        time.sleep(0.1)
+        self.write_sweep("CENT " + self.centre + "GHz")
 
     def span(self):
         self.erase_gui()
@@ -660,77 +729,128 @@ class SFP(ctk.CTkToplevel):
 
     def getspan(self):
         self.span = str(self.espan.get())
-        self.write("SPAN " + self.span + "GHz")
-        time.sleep(0.1)
+        self.write_sweep("SPAN " + self.span + "GHz")
 
-    def readtrace(self):
-        self.write("OUTPLIML")
-        self.frequency_points = self.VNA.read().split("\n") #Read frequency points, split at newline
+    def query_sweep(self):
+        """Returns the (start Hz, stop Hz, number of points) of the current sweep."""
+        try:
+            # One compound query; the replies may come back as one message or one per value
+            values = self.VNA.query("STAR?;STOP?;POIN?;").replace(";", "\n").split()
+            while len(values) < 3:
+                values += self.VNA.read().replace(";", "\n").split()
+            start, stop, points = values[:3]
+        except pyvisa.VisaIOError:
+            self.VNA.clear()  # Drop any half-read reply so the single queries below read their own answers
+            start, stop, points = self.VNA.query("STAR?"), self.VNA.query("STOP?"), self.VNA.query("POIN?")
+        return float(start), float(stop), int(float(points))
+
+    def get_frequency_points(self):
+        """Returns the stimulus frequencies of the current sweep in GHz.
+        Read from the VNA once and reused until the sweep is reprogrammed;
+        switching back to a sweep seen before reuses its frequencies.
+        Sweep changes made outside this panel (e.g. on the front panel after
+        LOCAL) are not detected, unless they change the number of points.
+        """
+        if self.frequency_points is None:
+            sweep = self.query_sweep()
+            self.frequency_points = self.frequency_axis_cache.get(sweep)
+            if self.frequency_points is None:
+                self.write("OUTPLIML")
+                # One line per point; parse only the first (stimulus) column, in C
+                self.frequency_points = np.loadtxt(io.StringIO(self.VNA.read()), delimiter=",", usecols=0, ndmin=1) / 1e9
+                self.frequency_axis_cache[sweep] = self.frequency_points
+        return self.frequency_points
 
-        self.write("FORM5;")
-        self.write("CHAN1;")
+    def readtrace(self):
+        """Returns the current trace as two arrays: frequencies (GHz) and magnitudes."""
+        with self.vna_lock:  # The axis and the magnitudes must come from the same sweep
+            frequency_points = self.get_frequency_points()
 
-        self.result_mags = self.VNA.query_binary_values("OUTPFORM;", container=tuple, header_fmt="hp")
+            self.VNA.write("FORM5;CHAN1;")  # Binary output format and channel select in a single transfer
 
-        print(len(self.frequency_points), len(self.result_mags))
+            # Read straight into an ndarray; FORM5 sends (value, 0) pairs so keep every other element.
+            # FORM5 values are 32-bit floats, keep them at that width for plotting and export
+            self.result_mags = self.VNA.query_binary_values("OUTPFORM;", container=np.array, header_fmt="hp")[0::2]
+            self.result_mags = self.result_mags.astype(np.float32, copy=False)
 
-        data_list = []
+            if len(frequency_points) != len(self.result_mags):
+                # The sweep was changed outside this panel, the cached axis belongs to another sweep
+                self.frequency_points = None
+                frequency_points = self.get_frequency_points()
 
-        for i, j in enumerate(self.frequency_points):
-            if i != (len(self.frequency_points)-1):
-                data_list.append([(float(self.frequency_points[i].split(",")[0].strip(" ")))/1e9, self.result_mags[i*2]])
+        print(len(frequency_points), len(self.result_mags))
 
-        return data_list
+        return frequency_points, self.result_mags
 
     def create_dataplot(self):
-        if self.canvas is not None:
-            self.canvas.get_tk_widget().destroy()
-            self.toolbar.destroy()
-            self.canvas = None
-            self.toolbar = None
-
-        self.data = self.readtrace()
-        self.frequencies = []
-        self.magnitudes = []
-        for i, j in enumerate(self.data):
-            self.frequencies.append(self.data[i][0])
-            self.magnitudes.append(self.data[i][1])
+        # Read the trace on a worker thread so the window keeps responding during the GPIB transfer
+        self.set_trace_controls(tk.DISABLED)  # Until the read finishes
+        self.trace_future = self.trace_executor.submit(self.readtrace)
+        self.after(50, self.show_dataplot)
+
+    def show_dataplot(self):
+        if not self.trace_future.done():
+            self.after(50, self.show_dataplot)
+            return
+
+        self.set_trace_controls(tk.NORMAL)
+
+        try:
+            self.frequencies, self.magnitudes = self.trace_future.result()
+        except Exception:  # Any error from the worker; an uncaught one would escape this after callback
+            print("FAILED TO READ TRACE")
+            return
+
+        if not self.plot_frame.winfo_exists():  # Another menu was opened while the trace was being read
+            return
+
+        # Matplotlib is only needed once a trace is displayed, not at application start-up
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        from matplotlib.figure import Figure
+        from matplotlib.ticker import FormatStrFormatter
 
         pprint.pprint(self.frequencies)
         pprint.pprint(self.magnitudes)
 
-        self.plot = plt.figure(figsize=(8, 6))
-        plt.plot(self.frequencies, self.magnitudes, label='Magnitude')
-        plt.xlabel('Frequency (GHz)')
-        plt.ylabel('Magnitude (dB)')
-        plt.title('Magnitude vs Frequency')
-        plt.legend()
-        plt.grid(False)
+        if self.plot is None:
+            self.plot = Figure(figsize=(8, 6))
+            self.ax = self.plot.add_subplot(111)
+            self.line, = self.ax.plot([], [], label='Magnitude')
+            self.ax.set_xlabel('Frequency (GHz)')
+            self.ax.set_ylabel('Magnitude (dB)')
+            self.ax.set_title('Magnitude vs Frequency')
+            self.ax.legend()
+            self.ax.grid(False)
+            self.ax.xaxis.set_major_formatter(FormatStrFormatter('%.2f'))  # Tick labels show two decimal places
+
+        # Only the line's data changes between traces
+        self.line.set_data(self.frequencies, self.magnitudes)
+        self.ax.relim()
+        self.ax.autoscale_view()
 
         num_ticks = 10
 
         # Generate tick positions evenly spaced between the first and last frequency values
         self.ticks = np.linspace(self.frequencies[0], self.frequencies[-1], num_ticks)
 
-        # Create formatted tick labels to show two decimal places
-        self.tick_labels = [f"{tick:.2f}" for tick in self.ticks]
+        # Set the x-axis ticks to the generated positions; the axis formatter labels them
+        self.ax.set_xticks(self.ticks)
 
-        # Set the x-axis ticks to the generated positions and labels
-        plt.xticks(self.ticks, self.tick_labels)
 
 
 
+        # Embed the Matplotlib figure into the CustomTkinter frame. The canvas and toolbar are built
+        # once per plot frame (start_gui makes a new frame) and reused for every later trace
+        if self.canvas is None:
+            self.canvas = FigureCanvasTkAgg(self.plot, master=self.plot_frame)
+            self.canvas.get_tk_widget().pack(side="top", fill="both", expand=True)
 
-        # Embed the Matplotlib figure into the CustomTkinter frame
-        self.canvas = FigureCanvasTkAgg(self.plot, master=self.plot_frame)
-        self.canvas.draw()
-        self.canvas.get_tk_widget().pack(side="top", fill="both", expand=True)
+            # Add a Matplotlib navigation toolbar (optional)
+            self.toolbar = NavigationToolbar2Tk(self.canvas, self.plot_frame)
+            self.toolbar.pack(side="bottom", fill="x")
 
-
-        # Add a Matplotlib navigation toolbar (optional)
-        self.toolbar = NavigationToolbar2Tk(self.canvas, self.plot_frame)
-        self.toolbar.update()
-        self.toolbar.pack(side="bottom", fill="x")
+        self.toolbar.update()  # Resets the toolbar's view history to the new trace
+        self.canvas.draw_idle()  # Render once Tk is idle instead of blocking this callback
 
     def exportcsv(self):
         self.erase_gui()
@@ -749,7 +869,7 @@ class SFP(ctk.CTkToplevel):
 
     def getexport(self):
         self.export_path = str(self.eexport.get())
-        self.data = self.readtrace()
+        self.frequencies, self.magnitudes = self.readtrace()
         self.today = (str(datetime.now())).split(" ")[0]
 
         self.full_directory = "C:\\Users\\alexszabo\\Desktop\\NEW POSITIONER FEB 2025\\CSV EXPORTS\\" + self.today
@@ -758,8 +878,9 @@ class SFP(ctk.CTkToplevel):
             os.makedirs(self.full_directory)
 
         with open(self.full_directory + "\\" + self.export_path + ".csv", 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerows(self.data)
+            # Frequency (GHz), magnitude (dB) per row, formatted in a single call. Stacking widens the
+            # magnitudes to float64 and '%s' writes the full repr with csv's \r\n endings, as csv.writer did
+            np.savetxt(file, np.column_stack((self.frequencies, self.magnitudes)), fmt='%s', delimiter=',', newline='\r\n')
 
     def close(self):
         self.destroy()
@@ -870,6 +991,9 @@ class threeDpat(ctk.CTkToplevel):
         # TEXTBOX
         self.textbox = ctk.CTkTextbox(self, height=500, width=500, wrap="word")
         self.textbox.grid(row=0, column=4, padx=10, pady=10)
+        self.textbox_text = ""
+        self.textbox_update_pending = False
+        self.displayed_text = None
 
         #close button
         self.close_button = ctk.CTkButton(self, text='close', command=self.close)
@@ -880,6 +1004,8 @@ class threeDpat(ctk.CTkToplevel):
 
         self.kill_task = threading.Event()
 
+        self._pending_acks = 0  # G-code lines sent to GRBL that have not been acknowledged yet
+
     def start_process(self):
         global thread
         self.kill_task.clear()
@@ -970,29 +1096,51 @@ class threeDpat(ctk.CTkToplevel):
         with open(file=file_name, mode='w', newline='') as file:
             writer=csv.writer(file)
             writer.writerow(['Phi (degrees)', 'Theta (degrees)', 'Frequency (GHz)', 'S21 Magnitude (dB)'])
-            self.move_to_position(x=0, y=0)
-            time.sleep(20)
-            phi_steps = 360 // self.phi + 1
-            theta_steps = 90 // self.theta + 1
-
-            for phi in range(phi_steps):
-                current_position = self.get_position()
-                self.update_textbox("MOVING TO POSITION: " + str(current_position[0]) + ", " + str(current_position[1] + self.phi))
-                self.move_to_position(x=current_position[0], y=current_position[1] + self.phi)
-                time.sleep(1)
-                for theta in range(theta_steps):
-                    current_position_1 = self.get_position()
-                    self.update_textbox("MOVING TO POSITION: " + str(self.theta) + ", " + str(phi))
-                    self.move_to_position(x=current_position_1[0] + self.theta, y=current_position_1[1])
-                    time.sleep(1)
-                    freqs=self.get_freq()
-                    mags=self.get_mag()
-                    for index in range(len(freqs)):
-                        row = [current_position_1[1], current_position_1[0] + self.theta, freqs[index], mags[index]]
-                        writer.writerow(row)
-                    if theta == 89:
-                        self.move_to_position(x=0, y=current_position_1)
-                        time.sleep(20)
+            try:
+                self.move_to_position(x=0, y=0)
+                if not self.wait_until_done():
+                    self.update_textbox("POSITIONER TIMED OUT, SCAN ABORTED")
+                    return
+                freqs = self.get_freq()  # The sweep does not change during a scan, read the axis once
+                phi_steps = 360 // self.phi + 1
+                theta_steps = 90 // self.theta + 1
+
+                for phi in range(phi_steps):
+                    current_position = self.get_position()
+                    self.update_textbox("MOVING TO POSITION: " + str(current_position[0]) + ", " + str(current_position[1] + self.phi))
+                    self.move_to_position(x=current_position[0], y=current_position[1] + self.phi)
+                    if not self.wait_until_done():
+                        self.update_textbox("POSITIONER TIMED OUT, SCAN ABORTED")
+                        return
+                    for theta in range(theta_steps):
+                        current_position_1 = self.get_position()
+                        self.update_textbox("MOVING TO POSITION: " + str(self.theta) + ", " + str(phi))
+                        self.move_to_position(x=current_position_1[0] + self.theta, y=current_position_1[1])
+                        if not self.wait_until_done():
+                            self.update_textbox("POSITIONER TIMED OUT, SCAN ABORTED")
+                            return
+                        try:
+                            self.single_sweep()  # The trace must not include points measured while the antenna was moving
+                        except pyvisa.VisaIOError:
+                            self.update_textbox("VNA SWEEP TIMED OUT, SCAN ABORTED")
+                            return
+                        mags=self.get_mag()
+                        # One row per frequency point, assembled as a single block and written in one call.
+                        # '%s' keeps the shortest round-trip text csv.writer produced; \r\n matches its line endings
+                        rows = np.column_stack((np.full(len(freqs), current_position_1[1]),
+                                                np.full(len(freqs), current_position_1[0] + self.theta),
+                                                freqs, mags))
+                        np.savetxt(file, rows, fmt='%s', delimiter=',', newline='\r\n')
+                        if theta == 89:
+                            self.move_to_position(x=0, y=current_position_1[1])
+                            if not self.wait_until_done():
+                                self.update_textbox("POSITIONER TIMED OUT, SCAN ABORTED")
+                                return
+            finally:
+                try:
+                    self.VNAwrite("CONT;")  # single_sweep leaves the analyzer in HOLD, put it back to sweeping live
+                except pyvisa.errors.Error:
+                    pass  # The session was closed by kill
 
 
 
@@ -1010,19 +1158,17 @@ class threeDpat(ctk.CTkToplevel):
         try:
 
             self.serial_connection = serial.Serial(settings.COM_PORT, settings.BAUD_RATE, timeout=2)
-            time.sleep(0.5)
-            self.serial_connection.write(b'?')
-            response = self.serial_connection.readline().decode('utf-8').strip()
-
-            if response.startswith('<Idle|WPos:'):
-                values = response.split(':')[1].split(',')
-                if len(values) == 6:
-                    x, y, z, a, b, c = values
-                    self.update_textbox(f"Connected. Position at connection time is X{x} Y{y} A{a}\n")
-                    #self.connect_button.configure(text='Connected', state=tk.DISABLED)
-
-                else:
-                    self.update_textbox("Invalid response format.")
+            self._pending_acks = 0
+            # Opening the port resets the controller; block until its start-up banner arrives (or the port times out)
+            self.serial_connection.read_until(b'Grbl')
+            self.serial_connection.write(GRBL_STATUS_QUERY)
+            response = self.read_status()  # Skips the rest of the banner and any start-up messages
+            match = GRBL_IDLE_WPOS.match(response)
+
+            if match:
+                x, y, z, a = (value.decode('ascii') for value in match.groups())  # Only the coordinates are decoded, for display
+                self.update_textbox(f"Connected. Position at connection time is X{x} Y{y} A{a}\n")
+                #self.connect_button.configure(text='Connected', state=tk.DISABLED)
             else:
                 self.update_textbox("Failed to connect: Invalid response.")
         except serial.SerialException as e:
@@ -1049,13 +1195,48 @@ class threeDpat(ctk.CTkToplevel):
         time.sleep(0.5)
 
     def move_to_position(self, x, y):
-        self.serial_connection.write(f'G0 X{x} Y{y} Z0\n'.encode('utf-8'))  # Include default Z value
+        self.serial_connection.write(GRBL_MOVE_FMT % (x, y))
+        self._pending_acks += 1
 
+    def wait_until_done(self, timeout=120):
+        """Blocks until GRBL has finished every queued move. Returns True
+        when the positioner is done, False if the timeout expired.
 
+        GRBL only acknowledges a G4 P0 dwell once its planner buffer is empty,
+        so the 'ok' for the dwell is the motion-complete notification.
 
+        Args:
+            timeout (float): Maximum number of seconds to wait
+        """
+        self.serial_connection.write(GRBL_DWELL_SYNC)
+        self._pending_acks += 1
+        t0 = time.monotonic()
+        while self._pending_acks > 0:
+            if time.monotonic() - t0 > timeout:
+                self._pending_acks = 0
+                return False
+            line = self.serial_connection.readline().strip()  # Blocks until a line arrives or the port times out
+            if line == b'ok' or line.startswith(b'error'):
+                self._pending_acks -= 1
+        return True
+
+    def single_sweep(self, timeout=60000):
+        """Triggers one fresh sweep and blocks until the VNA has finished it,
+        so the trace read afterwards was measured entirely at the current position.
+
+        Args:
+            timeout (int): Maximum number of milliseconds to wait for the sweep
+        """
+        previous_timeout = self.VNA.timeout
+        self.VNA.timeout = timeout  # A slow sweep can outlast the default VISA timeout
+        try:
+            self.VNA.query("OPC?;SING;")
+        finally:
+            self.VNA.timeout = previous_timeout
 
     def home(self):
-        self.serial_connection.write(('$H\n').encode('utf-8'))
+        self.serial_connection.write(GRBL_HOME_ALL)
+        self._pending_acks += 1
 
     def kill(self):
         self.serial_connection.close()
@@ -1076,10 +1257,19 @@ class threeDpat(ctk.CTkToplevel):
     def update_textbox(self, text):
         #self.textbox.delete("1.0", "end")  # Clear previous text
         #self.textbox.insert("end", text)  # Insert new text
-        self.textbox.after(0, self.safe_update_textbox, text)
-
-    def safe_update_textbox(self, text):
+        # Called from the scan thread; only the latest text is shown, so one pending refresh is enough
+        self.textbox_text = text
+        if not self.textbox_update_pending:
+            self.textbox_update_pending = True
+            self.textbox.after_idle(self.safe_update_textbox)
+
+    def safe_update_textbox(self):
+        self.textbox_update_pending = False
+        text = self.textbox_text
+        if text == self.displayed_text:  # Already showing this, skip the redraw
+            return
         if self.textbox.winfo_exists():
+            self.displayed_text = text
             self.textbox.delete("1.0", "end")  # Clear previous text
             self.textbox.insert("end", text)  # Insert new text
 
@@ -1096,22 +1286,13 @@ class threeDpat(ctk.CTkToplevel):
         Args:
             chan (str): String specifying the channel to get the values from
         """
-        self.VNAwrite("FORM5;")  # Use binary format to output data
-        self.VNAwrite(chan + ";")  # Select channel
-        self.VNAwrite("LOGM;")  # Show logm values - TRY CALC:MEAS:FORM MLOG and CALC:MEAS:FORM PHAS
+        # Use binary format to output data, select channel and show logm values in a single transfer
+        self.VNAwrite("FORM5;" + chan + ";LOGM;")  # TRY CALC:MEAS:FORM MLOG and CALC:MEAS:FORM PHAS
         # Might let you switch between the log mag and phase measurements. Should wrap this whole thing up ez pz!
-        res = []
-
-
-
         aux = self.VNA.query_binary_values(
-            "OUTPFORM;", container=tuple, header_fmt="hp"
-        )  # Ask for the values from channel and format them as tuple
-        for i in range(
-                0, len(aux), 2
-        ):  # Only get the first value of every data pair because the other is zero
-            res.append(aux[i])
-        return np.asarray(res)
+            "OUTPFORM;", container=np.array, header_fmt="hp"
+        )  # Ask for the values from channel straight into a numpy array
+        return aux[0::2]  # Only get the first value of every data pair because the other is zero
 
     def get_freq(self):
         """Returns a numpy array with the values of frequency
@@ -1120,33 +1301,22 @@ class threeDpat(ctk.CTkToplevel):
         self.VNAwrite(
             "OUTPLIML;"
         )  # Asks for the limit test results to extract the stimulus components
-        aux = []
-        x = self.VNAread().split("\n")  # Split the string for each point
-
-
-
-        for i in x:
-            if i == "":
-                break
-            aux.append(
-                float(i.split(",")[0])
-            )  # Split each string and get only the first value as a float number
-        return np.asarray(aux)
+        x = self.VNAread()
+        # One line per point; parse only the first (stimulus) column, in C
+        return np.loadtxt(io.StringIO(x), delimiter=",", usecols=0, ndmin=1)
 
     def get_position(self):
         try:
-            self.serial_connection.flushInput()
-            self.serial_connection.write(('?').encode('utf-8'))
-            time.sleep(0.1)
-            response = self.serial_connection.readline().decode('utf-8').strip()
+            self.serial_connection.write(GRBL_STATUS_QUERY)
+            response = self.read_status()
+            match = GRBL_IDLE_WPOS.match(response)
 
-            if '<Idle|WPos:' in response:
+            if match:
                 try:
-                    values = response.split('|')[1].split(':')[1].split(',')
-                    x, y, z, a = float(values[0]), float(values[1]), float(values[2]), float(values[3])
+                    x, y, z, a = (float(value) for value in match.groups())
                     self.update_textbox(f"Current Position: X{x} Y{y} A{a}")
-                    return float(x), float(y), float(a)
-                except (IndexError, ValueError):
+                    return x, y, a
+                except ValueError:
                     self.update_textbox("Invalid response format for position.")
                     return None, None, None
             else:
@@ -1156,6 +1326,18 @@ class threeDpat(ctk.CTkToplevel):
             self.update_textbox(f"Error in getting position: {str(e)}")
             return None, None, None
 
+    def read_status(self, timeout=2):
+        """Returns the next GRBL status report, consuming any acknowledgements
+        still queued ahead of it. Returns b'' if none arrives in time."""
+        t0 = time.monotonic()
+        while time.monotonic() - t0 < timeout:
+            line = self.serial_connection.readline().strip()  # Blocks until newline or port timeout
+            if line.startswith(b'<'):
+                return line
+            if line == b'ok' or line.startswith(b'error'):
+                self._pending_acks = max(self._pending_acks - 1, 0)
+        return b''
+
 
 
 class App(ctk.CTk):